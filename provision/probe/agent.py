@@ -1,23 +1,328 @@
 #!/bin/python3
 
 # Global
+import asyncio
+from contextlib import asynccontextmanager
+import functools
+import io
 import os
 from datetime import datetime, timedelta, timezone
+import logging
 from pathlib import Path
-from typing import Annotated, Literal
+from typing import Annotated, Any, Literal
 import re
+import time
 import uuid
 
 # External
-from fastapi import FastAPI, status, Query, HTTPException
+import aiofiles
+from fastapi import FastAPI, status, Query, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+import numpy as np
+import orjson
 import polars as pl
-import polars.selectors as ps
 from pydantic import BaseModel, Field, computed_field, field_validator, ConfigDict
 
 # The data measurement jsonl file
 DATA_MEASUREMENT_DATA_JSONL_PATH = os.environ.get("DATA_MEASUREMENT_DATA_JSONL_PATH", "/mnt/usr/application-probe/measurement.jsonl")
 
+# The schema of the measurement record
+DATA_MEASUREMENT_SCHEMA: dict[str, pl.DataType] = {
+    "timestamp": pl.String,
+    "protocol": pl.String,
+    "status": pl.String,
+    "duration_ms": pl.Float64,
+}
+
+# The ingested cache of measurement file, mapped by file path into tuple of
+# (inode, bytes read, records per protocol). Records are stored column-wise as three
+# parallel arrays of (epoch seconds, is success, duration ms) so the window lookup
+# is one boolean mask plus a few vectorized reductions
+_INGESTED_CACHE: dict[Path, tuple[int, int, dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]]]] = {}
+
+# The retention of cached records, grown to the largest requested window
+_INGESTED_RETENTION: timedelta = timedelta(days=1)
+
+# The block size of a single ingest read, bounds peak memory on the bootstrap pass
+INGEST_CHUNK_SIZE: int = 1 << 20
+
+# The block size of one reverse step while locating the bootstrap start offset
+BOOTSTRAP_STEP_SIZE: int = 1 << 16
+
+# The interval of the background tail follower keeping the ingest cache warm
+INGEST_FOLLOW_INTERVAL: float = 1.0
+
+# The percentile points of the latency measurement, matched with the percentile group model
+PERCENTILE_POINTS: list[float] = [0.01, 0.05, 0.10, 0.25, 0.50, 0.75, 0.95, 0.99]
+
+# The pattern of the window parameter, compiled once instead of per request
+_WINDOW_RE: re.Pattern = re.compile(r"^(?P<ref_value>\d+)(?P<ref_unit>m|h|d)$")
+
+# The mapping of window unit into timedelta keyword
+_WINDOW_UNIT: dict[str, str] = {"m": "minutes", "h": "hours", "d": "days"}
+
+# The time-to-live of the prebuilt health body, liveness probes do not need sub-second precision
+_HEALTH_TTL: float = 1.0
+
+# The cached health body, mapped as (expire monotonic tick, serialized body)
+_HEALTH_CACHE: dict[str, Any] = {"expire": 0.0, "body": b""}
+
+
+def _utcnow_iso_z() -> str:
+    # Formats the current UTC time as ISO-8601 with a Z suffix without the
+    # isoformat() + replace("+00:00", "Z") intermediate strings
+    moment = time.time()
+    whole = int(moment)
+    return f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(whole))}.{int((moment - whole) * 1e6):06d}Z"
+
+
+def _line_timestamp(block: bytes, start: int) -> bytes:
+    # Pulls the raw timestamp value out of a serialized record without decoding it,
+    # the collector always writes the timestamp as the first field
+    key = block.find(b'"timestamp":', start, start + 80)
+    if key == -1:
+        return b""
+    value = block.find(b'"', key + 12) + 1
+    if value == 0:
+        return b""
+    return block[value:block.find(b'"', value)]
+
+
+async def _bootstrap_offset(_file, size: int, retention_cutoff: datetime) -> int:
+    """Locate the byte offset of the first record inside the retention window
+
+    Records are appended in timestamp order and the ISO-8601 Z form compares
+    lexicographically, so the scan steps back from the end of the file in fixed
+    blocks and stops once a record older than the cutoff shows up. A fresh agent
+    then parses only the retained window instead of the whole history.
+    """
+
+    cutoff_key = retention_cutoff.strftime("%Y-%m-%dT%H:%M:%S.%fZ").encode()
+    candidate = size
+    position = size
+    while position > 0:
+        step = min(BOOTSTRAP_STEP_SIZE, position)
+        position -= step
+        await _file.seek(position)
+        # The slack past the step keeps the timestamp of a line starting near the
+        # block edge inside the buffer
+        block = await _file.read(min(size - position, step + 80))
+
+        # The first complete line of the block, a block without one is all fragment
+        start = 0 if position == 0 else block.find(b"\n", 0, step) + 1
+        if start == 0 and position != 0:
+            continue
+
+        # Walk the block lines forward to the earliest record inside the window
+        first_stamp = None
+        while 0 <= start < step:
+            stamp = _line_timestamp(block, start)
+            if first_stamp is None:
+                first_stamp = stamp
+            if stamp and stamp >= cutoff_key:
+                candidate = position + start
+                break
+            boundary = block.find(b"\n", start, step)
+            if boundary == -1:
+                break
+            start = boundary + 1
+
+        # An older record precedes the candidate, the scan is done
+        if first_stamp and first_stamp < cutoff_key:
+            return candidate
+
+    return candidate
+
+
+async def _ingest_measurement(path: Path, retention_cutoff: datetime) -> dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Read only the appended tail of the measurement file and keep parsed records cached
+
+    The measurement file is append-only so the already-parsed prefix never changes. The cache
+    keeps (inode, bytes read, records per protocol) per file and each call decodes only the
+    bytes appended since the previous call, then drops records older than the retention cutoff.
+    Records are partitioned by protocol into parallel (epoch, is success, duration) arrays.
+    """
+
+    # Stat
+    file_stat = os.stat(path)
+    cached = _INGESTED_CACHE.get(path)
+
+    # Reuse on unchanged file
+    if cached is not None and cached[0] == file_stat.st_ino and cached[1] == file_stat.st_size:
+        return cached[2]
+
+    # Reset on rotated or truncated file
+    if cached is not None and (cached[0] != file_stat.st_ino or cached[1] > file_stat.st_size):
+        cached = None
+
+    # Read the appended tail in bounded blocks, only complete lines are parsed
+    # and the trailing fragment stays on disk for the next read
+    offset = cached[1] if cached is not None else 0
+    chunks: list[pl.DataFrame] = []
+    fragment = b""
+    read_total = 0
+    async with aiofiles.open(path, "rb") as _file:
+        if cached is None and file_stat.st_size > BOOTSTRAP_STEP_SIZE:
+            # A fresh agent starts at the retention cutoff instead of parsing the history
+            offset = await _bootstrap_offset(_file, file_stat.st_size, retention_cutoff)
+        await _file.seek(offset)
+        while True:
+            block = await _file.read(INGEST_CHUNK_SIZE)
+            if not block:
+                break
+            read_total += len(block)
+            block = fragment + block
+            boundary = block.rfind(b"\n")
+            if boundary == -1:
+                fragment = block
+                continue
+            chunks.append(pl.read_ndjson(
+                source=io.BytesIO(block[:boundary + 1]),
+                schema=DATA_MEASUREMENT_SCHEMA,
+                ignore_errors=True,
+            ))
+            fragment = block[boundary + 1:]
+
+    if not chunks:
+        if cached is not None:
+            return cached[2]
+        return {}
+
+    # Parse
+    parsed = pl.concat(chunks).with_columns(
+        # The collector emits ISO-8601 with a Z suffix, the explicit format skips
+        # per-row format inference and malformed timestamps turn into nulls
+        pl.col("timestamp").str.to_datetime(format="%Y-%m-%dT%H:%M:%S%.fZ", time_zone="UTC", strict=False).name.keep(),
+    ).drop_nulls(
+        subset=["timestamp", "protocol"],
+    ).with_columns(
+        (pl.col("timestamp").dt.epoch(time_unit="us").cast(pl.Float64) / 1e6).alias("epoch"),
+        pl.col("status").eq("success").alias("is_success"),
+    )
+
+    # Chain, append the new columns onto the cached per-protocol arrays
+    groups: dict[str, tuple[np.ndarray, np.ndarray, np.ndarray]] = dict(cached[2]) if cached is not None else {}
+    for (proto,), group in parsed.group_by("protocol"):
+        epoch = group["epoch"].to_numpy().astype(np.float64, copy=False)
+        is_success = group["is_success"].to_numpy().astype(np.bool_, copy=False)
+        duration = group["duration_ms"].to_numpy().astype(np.float64, copy=False)
+        if proto in groups:
+            held = groups[proto]
+            epoch = np.concatenate([held[0], epoch])
+            is_success = np.concatenate([held[1], is_success])
+            duration = np.concatenate([held[2], duration])
+        groups[proto] = (epoch, is_success, duration)
+
+    # Trim
+    retention_epoch = retention_cutoff.timestamp()
+    for proto, (epoch, is_success, duration) in groups.items():
+        keep = epoch >= retention_epoch
+        if not keep.all():
+            groups[proto] = (epoch[keep], is_success[keep], duration[keep])
+
+    # Set
+    _INGESTED_CACHE[path] = (file_stat.st_ino, offset + read_total - len(fragment), groups)
+
+    return groups
+
+
+@functools.lru_cache(maxsize=128)
+def _aggregate_latency(path: Path, protocol: str, cutoff: datetime, version: int) -> dict:
+    """Aggregate the cached measurement records into observation, percentile and stats groups
+
+    The result is memoized: `version` is the number of ingested bytes, so two calls with the
+    same (path, protocol, cutoff) only recompute when the measurement file has grown.
+    """
+
+    # Search, the cache is already partitioned by protocol and each protocol's
+    # epochs are in append order, so the window is a binary-searched slice and
+    # the three column views below cost no copy at all
+    cached = _INGESTED_CACHE.get(path)
+    groups = cached[2] if cached is not None else {}
+    held = groups.get(protocol)
+    start = int(np.searchsorted(held[0], cutoff.timestamp(), side="left")) if held is not None else 0
+
+    if held is None or start == held[0].size:
+        return {
+            "observation": {
+                "count": 0,
+                "success_rate": None,
+                "first_seen": None,
+                "last_seen": None,
+            },
+            "percentile": None,
+            "stats": None,
+        }
+
+    epoch = held[0][start:]
+    is_success = held[1][start:]
+    duration = held[2][start:]
+
+    # Vectorize duration statistics over a single contiguous float64 array,
+    # one pass for all percentile points instead of one filtered pass per point
+    latencies = duration[is_success]
+    latencies = latencies[~np.isnan(latencies)]
+    if latencies.size > 0:
+        percentiles = [round(float(p), 3) for p in np.quantile(latencies, PERCENTILE_POINTS, method="nearest")]
+        stats = {
+            "min": round(float(latencies.min()), 3),
+            "max": round(float(latencies.max()), 3),
+            "avg": round(float(latencies.mean()), 3),
+            "med": round(float(np.median(latencies)), 3),
+        }
+    else:
+        percentiles = [None] * len(PERCENTILE_POINTS)
+        stats = {"min": None, "max": None, "avg": None, "med": None}
+
+    return {
+        "observation": {
+            "count": int(epoch.size),
+            "success_rate": round(float(is_success.sum() / epoch.size * 100), 3),
+            "first_seen": datetime.fromtimestamp(float(epoch.min()), tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+            "last_seen": datetime.fromtimestamp(float(epoch.max()), tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ"),
+        },
+        "percentile": {
+            f"p{int(point * 100)}": {"value": value, "unit": "ms"}
+            for point, value in zip(PERCENTILE_POINTS, percentiles)
+        },
+        "stats": {
+            "min": {"value": stats["min"], "unit": "ms"},
+            "max": {"value": stats["max"], "unit": "ms"},
+            "avg": {"value": stats["avg"], "unit": "ms"},
+            "med": {"value": stats["med"], "unit": "ms"}
+        }
+    }
+
+
+async def _follow_measurement():
+    # Tails the measurement file in the background so the ingest cache stays warm
+    # and requests only ever parse the short tail appended since the last second
+    path = Path(DATA_MEASUREMENT_DATA_JSONL_PATH)
+    while True:
+        if path.exists():
+            try:
+                await _ingest_measurement(
+                    path=path,
+                    retention_cutoff=datetime.now(timezone.utc) - _INGESTED_RETENTION,
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # A corrupt block raises out of the parser, the follower logs it
+                # and keeps tailing, nothing restarts a dead cache warmer
+                logging.getLogger("uvicorn.error").exception("Measurement ingest failed, retry on next interval")
+        await asyncio.sleep(INGEST_FOLLOW_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    follower = asyncio.create_task(_follow_measurement())
+    yield
+    follower.cancel()
+    await asyncio.gather(follower, return_exceptions=True)
+
+
 # Build
 app = FastAPI(
     title="Probe",
@@ -27,6 +332,8 @@ app = FastAPI(
     docs_url="/documentation",
     redoc_url=None,
     debug=False,
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
 # CORS middleware
@@ -58,26 +365,25 @@ class RequestParametersModel(BaseModel):
         return value.lower().strip()
 
     @computed_field
-    @property
+    @functools.cached_property
     def current(self) -> datetime:
         return datetime.now(timezone.utc)
 
     @computed_field
-    @property
+    @functools.cached_property
     def cutoff(self) -> datetime:
-        return self.current - self.delta
+        # Floor to a coarse bucket (1/60 of the window, at least 1 second) so
+        # consecutive requests inside the bucket share an identical cutoff and
+        # the aggregation memo can serve them without recomputing
+        bucket = max(1, int(self.delta.total_seconds() // 60))
+        epoch = int((self.current - self.delta).timestamp())
+        return datetime.fromtimestamp(epoch - epoch % bucket, tz=timezone.utc)
 
     @computed_field
-    @property
+    @functools.cached_property
     def delta(self) -> timedelta:
-        components = re.compile(r"^(?P<ref_value>\d+)(?P<ref_unit>m|h|d)$").match(self.window)
-        ref_value, ref_unit = components["ref_value"], components["ref_unit"]
-        if ref_unit == "m":
-            return timedelta(minutes=int(ref_value))
-        elif ref_unit == "h":
-            return timedelta(hours=int(ref_value))
-        elif ref_unit == "d":
-            return timedelta(days=int(ref_value))
+        components = _WINDOW_RE.match(self.window)
+        return timedelta(**{_WINDOW_UNIT[components["ref_unit"]]: int(components["ref_value"])})
 
 
 class _MesurementUnitModel(BaseModel):
@@ -109,11 +415,13 @@ class _GroupStatsModel(BaseModel):
 class _GroupObservationModel(BaseModel):
     count: int = Field(default=None, description="Count of records")
     success_rate: float | None = Field(default=None, description="Success rate of latency measurement")
+    first_seen: datetime | None = Field(default=None, description="First seen of latency measurement in the window")
+    last_seen: datetime | None = Field(default=None, description="Last seen of latency measurement in the window")
 
 
 class ResponseLatencyModel(BaseModel):
     response_id: str = Field(default_factory=lambda: uuid.uuid4().hex, description="Response ID")
-    timestamp: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"), description="Timestamp of returned data")
+    timestamp: str = Field(default_factory=_utcnow_iso_z, description="Timestamp of returned data")
     status: str = Field(default=..., description="Status of returned data")
     parameters: dict[str, str] = Field(default_factory=dict, description="Parameters of latency measurement")
     observation: _GroupObservationModel | None = Field(default=None, description="Observation of latency measurement")
@@ -163,11 +471,11 @@ class ResponseLatencyModel(BaseModel):
     status_code=status.HTTP_200_OK,
 )
 async def getApplicationHealth():
-    now = datetime.now(timezone.utc)
-    return {
-        "timestamp": now.isoformat(timespec="milliseconds", sep="T").replace("+00:00", "Z"),
-        "timezone": now.tzname(),
-    }
+    tick = time.monotonic()
+    if tick >= _HEALTH_CACHE["expire"]:
+        _HEALTH_CACHE["body"] = orjson.dumps({"timestamp": _utcnow_iso_z(), "timezone": "UTC"})
+        _HEALTH_CACHE["expire"] = tick + _HEALTH_TTL
+    return Response(content=_HEALTH_CACHE["body"], media_type="application/json")
 
 
 @app.get(
@@ -177,6 +485,7 @@ async def getApplicationHealth():
     description="Fetch latency metrics statistics",
     status_code=status.HTTP_200_OK,
     response_model=ResponseLatencyModel,
+    response_class=ORJSONResponse,
 )
 async def fetchLatencyMetrics(
     query: Annotated[RequestParametersModel, Query()],
@@ -187,11 +496,11 @@ async def fetchLatencyMetrics(
 
     # Handle
     if not Path(DATA_MEASUREMENT_DATA_JSONL_PATH).exists():
-        return HTTPException(
+        raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail={
                 "response_id": uuid.uuid4().hex,
-                "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+                "timestamp": _utcnow_iso_z(),
                 "status": "error",
                 "detail": "Resource related to latency measurement not found",
                 "parameters": parameters,
@@ -201,84 +510,37 @@ async def fetchLatencyMetrics(
             }
         )
 
-    # Search
-    result = pl.scan_ndjson(
-        source=Path(DATA_MEASUREMENT_DATA_JSONL_PATH),
-        schema={
-            "timestamp": pl.String,
-            "protocol": pl.String,
-            "status": pl.String,
-            "duration_ms": pl.Float64,
-        },
-        infer_schema_length=None,
-        low_memory=False,
-        ignore_errors=True,
-    ).filter(
-        (pl.col("protocol") == query.protocol)
-        &
-        (pl.col("timestamp").str.to_datetime(time_zone="UTC") >= pl.lit(query.cutoff, pl.Datetime(time_zone="UTC")))
-    ).with_columns(
-        pl.col("timestamp").str.to_datetime(time_zone="UTC").name.keep(),
-        pl.col("status").replace({"success": True, "error": False}, default=False, return_dtype=pl.Boolean).alias("is_success"),
-        pl.col("status").replace({"success": False, "error": True}, default=False, return_dtype=pl.Boolean).alias("is_error"),
-    ).select(
-        pl.count().alias("count"),
-        pl.when(pl.count() == 0)
-            .then(None)
-            .otherwise((pl.col("is_success").sum() / pl.count()).mul(100))
-            .cast(pl.Float64)
-            .alias("success_rate"),
-        pl.col("timestamp").min().alias("first_seen"),
-        pl.col("timestamp").max().alias("last_seen"),
-        pl.col("duration_ms").filter(pl.col("is_success")).quantile(0.01).alias("p1_duration_ms"),
-        pl.col("duration_ms").filter(pl.col("is_success")).quantile(0.05).alias("p5_duration_ms"),
-        pl.col("duration_ms").filter(pl.col("is_success")).quantile(0.1).alias("p10_duration_ms"),
-        pl.col("duration_ms").filter(pl.col("is_success")).quantile(0.25).alias("p25_duration_ms"),
-        pl.col("duration_ms").filter(pl.col("is_success")).quantile(0.5).alias("p50_duration_ms"),
-        pl.col("duration_ms").filter(pl.col("is_success")).quantile(0.75).alias("p75_duration_ms"),
-        pl.col("duration_ms").filter(pl.col("is_success")).quantile(0.95).alias("p95_duration_ms"),
-        pl.col("duration_ms").filter(pl.col("is_success")).quantile(0.99).alias("p99_duration_ms"),
-        pl.col("duration_ms").filter(pl.col("is_success")).mean().alias("avg_duration_ms"),
-        pl.col("duration_ms").filter(pl.col("is_success")).median().alias("med_duration_ms"),
-        pl.col("duration_ms").filter(pl.col("is_success")).min().alias("min_duration_ms"),
-        pl.col("duration_ms").filter(pl.col("is_success")).max().alias("max_duration_ms"),
-    ).with_columns(ps.numeric().round(3)).collect()
-
-    if result.is_empty():
-        return {
-            "status": "success",
-            "parameters": parameters,
-            "observation": {
-                "count": 0,
-            }
-        }
+    # Widen the cache retention when a larger window is requested,
+    # dropped records can only come back from a full re-read
+    global _INGESTED_RETENTION
+    if query.delta > _INGESTED_RETENTION:
+        _INGESTED_RETENTION = query.delta
+        _INGESTED_CACHE.pop(Path(DATA_MEASUREMENT_DATA_JSONL_PATH), None)
+
+    # Ingest
+    path = Path(DATA_MEASUREMENT_DATA_JSONL_PATH)
+    await _ingest_measurement(
+        path=path,
+        retention_cutoff=query.current - _INGESTED_RETENTION,
+    )
 
-    bundle = result.row(0, named=True)
+    # Aggregate, memoized on (path, protocol, cutoff, ingested bytes) so requests
+    # inside the same cutoff bucket with unchanged data are served from the memo
+    aggregated = _aggregate_latency(
+        path=path,
+        protocol=query.protocol,
+        cutoff=query.cutoff,
+        version=_INGESTED_CACHE[path][1] if path in _INGESTED_CACHE else 0,
+    )
+
+    # Respond with a single C-level serialization pass, the returned Response
+    # bypasses the Pydantic revalidation + stdlib json re-encode walk
     output = {
+        "response_id": uuid.uuid4().hex,
+        "timestamp": _utcnow_iso_z(),
         "status": "success",
         "parameters": parameters,
-        "observation": {
-            "count": bundle["count"],
-            "success_rate": bundle["success_rate"],
-            "first_seen": bundle["first_seen"],
-            "last_seen": bundle["last_seen"],
-        },
-        "percentile": {
-            "p1": {"value": bundle["p1_duration_ms"], "unit": "ms"},
-            "p5": {"value": bundle["p5_duration_ms"], "unit": "ms"},
-            "p10": {"value": bundle["p10_duration_ms"], "unit": "ms"},
-            "p25": {"value": bundle["p25_duration_ms"], "unit": "ms"},
-            "p50": {"value": bundle["p50_duration_ms"], "unit": "ms"},
-            "p75": {"value": bundle["p75_duration_ms"], "unit": "ms"},
-            "p95": {"value": bundle["p95_duration_ms"], "unit": "ms"},
-            "p99": {"value": bundle["p99_duration_ms"], "unit": "ms"},
-        },
-        "stats": {
-            "min": {"value": bundle["min_duration_ms"], "unit": "ms"},
-            "max": {"value": bundle["max_duration_ms"], "unit": "ms"},
-            "avg": {"value": bundle["avg_duration_ms"], "unit": "ms"},
-            "med": {"value": bundle["med_duration_ms"], "unit": "ms"}
-        }
+        **aggregated,
     }
 
-    return output
+    return ORJSONResponse(content=output)
@@ -1,11 +1,10 @@
 #!/bin/python3
 
 # Global
+import os
 import sys
 from typing import Callable, Awaitable, TypeVar, Tuple, Optional, Any
-from datetime import datetime, timezone
 import signal
-import json
 import asyncio
 import functools
 import time
@@ -19,8 +18,9 @@ import logging
 # External
 import aioping
 import aiohttp
-import aiofiles
+import orjson
 import structlog
+import uvloop
 
 
 # Build
@@ -57,6 +57,14 @@ def configure_logging(
 T = TypeVar("T")
 
 
+def _utcnow_iso_z() -> str:
+    # Formats the current UTC time as ISO-8601 with a Z suffix without the
+    # isoformat() + replace("+00:00", "Z") intermediate strings
+    moment = time.time()
+    whole = int(moment)
+    return f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(whole))}.{int((moment - whole) * 1e6):06d}Z"
+
+
 def measure_latency(
     func: Callable[..., Awaitable[T]]
 ) -> Callable[..., Awaitable[Tuple[Optional[float], str, Optional[str]]]]:
@@ -91,43 +99,89 @@ async def run_tcp(host: str, port: int, timeout: float = 1.0) -> None:
     await writer.wait_closed()
 
 
-@measure_latency
-async def run_udp(host: str, port: int, timeout: float = 1.0) -> None:
-    loop = asyncio.get_running_loop()
-    response_fut = loop.create_future()
+class _UDPProbeProtocol(asyncio.DatagramProtocol):
+    # The latest probe owns the pending future; if ticks overlap because the
+    # interval is set below the probe timeout, a reply resolves the newest probe
+    # and the older one times out on its own future without disturbing it
+    def __init__(self):
+        self.pending: Optional[asyncio.Future] = None
 
-    class ClientProtocol(asyncio.DatagramProtocol):
-        def connection_made(self, transport):
-            self.transport = transport
-            self.transport.sendto(b"\x00")
+    def datagram_received(self, data, addr):
+        if self.pending is not None and not self.pending.done():
+            self.pending.set_result(None)
 
-        def datagram_received(self, data, addr):
-            if not response_fut.done():
-                response_fut.set_result(None)
+    def error_received(self, exc):
+        if self.pending is not None and not self.pending.done():
+            self.pending.set_exception(exc)
 
-        def error_received(self, exc):
-            if not response_fut.done():
-                response_fut.set_exception(exc)
+    def connection_lost(self, exc):
+        if exc is not None and self.pending is not None and not self.pending.done():
+            self.pending.set_exception(exc)
 
-    transport, _ = await loop.create_datagram_endpoint(
-        ClientProtocol,
+
+# The shared UDP endpoints, one connected socket per (host, port) reused across probes
+# so each tick costs a single send instead of a socket create, register and teardown
+_UDP_ENDPOINTS: dict[Tuple[str, int], Tuple[asyncio.DatagramTransport, _UDPProbeProtocol]] = {}
+
+
+async def _get_udp_endpoint(host: str, port: int) -> Tuple[asyncio.DatagramTransport, _UDPProbeProtocol]:
+    cached = _UDP_ENDPOINTS.get((host, port))
+    if cached is not None and not cached[0].is_closing():
+        return cached
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(
+        _UDPProbeProtocol,
         remote_addr=(host, port),
     )
+    _UDP_ENDPOINTS[(host, port)] = (transport, protocol)
+    return transport, protocol
 
+
+def _close_udp_endpoints() -> None:
+    while _UDP_ENDPOINTS:
+        transport, _ = _UDP_ENDPOINTS.popitem()[1]
+        transport.close()
+
+
+@measure_latency
+async def run_udp(host: str, port: int, timeout: float = 1.0, loop: asyncio.AbstractEventLoop | None = None) -> None:
+    transport, protocol = await _get_udp_endpoint(host, port)
+    fut = (loop or asyncio.get_running_loop()).create_future()
+    protocol.pending = fut
+    transport.sendto(b"\x00")
     try:
-        await asyncio.wait_for(response_fut, timeout)
+        await asyncio.wait_for(fut, timeout)
     finally:
-        transport.close()
+        # Clear only this probe's future, an overlapping probe may own it by now
+        if protocol.pending is fut:
+            protocol.pending = None
+
+
+# The shared HTTP client session, created lazily on the running loop and reused across
+# probes so the connection pool and DNS cache survive between ticks
+_HTTP_SESSION: Optional[aiohttp.ClientSession] = None
+
+
+def _get_http_session() -> aiohttp.ClientSession:
+    global _HTTP_SESSION
+    if _HTTP_SESSION is None or _HTTP_SESSION.closed:
+        _HTTP_SESSION = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=32, ttl_dns_cache=300, enable_cleanup_closed=True),
+        )
+    return _HTTP_SESSION
 
 
 @measure_latency
-async def run_http(url: str, headers: dict[str, str] | None = None, timeout: float = 1.0) -> None:
+async def run_http(url: str, session: aiohttp.ClientSession | None = None, headers: dict[str, str] | None = None, timeout: float = 1.0) -> None:
     timeout_cfg = aiohttp.ClientTimeout(total=timeout)
-    async with aiohttp.ClientSession(headers=headers, timeout=timeout_cfg) as session:
-        async with session.get(url) as resp:
-            resp.raise_for_status()
+    async with (session or _get_http_session()).get(url, headers=headers, timeout=timeout_cfg) as resp:
+        resp.raise_for_status()
 
 
+# The pattern of protocol-scoped configuration keys, e.g. "tcp_port" or "http-path",
+# compiled once instead of per (protocol, key) pair
+_CFG_RE: re.Pattern = re.compile(r"^(?P<proto>icmp|tcp|udp|http)[-_](?P<key>.+)$")
+
 PROTOCOL_RUNNERS: dict[str, Callable[..., asyncio.Future]] = {
     "icmp": run_icmp,
     "tcp": run_tcp,
@@ -169,11 +223,13 @@ PROTOCOL_DEFAULT_CONFIGURATIONS: dict[str, dict[str, Any]] = {
         "host": "[host]",
         "port": 53,
         "timeout": 2.0,
+        "loop": None,
     },
     "http": {
         "url": "[url]",
         "timeout": 2.0,
         "headers": None,
+        "session": None,
     },
 }
 
@@ -182,18 +238,21 @@ async def collect(
     protocol: str,
     func: Callable[..., asyncio.Future],
     queue: asyncio.Queue,
+    target: Optional[str] = None,
     **kwargs,
 ):
     latency, status, err = await func(**kwargs)
     record = {
-        "timestamp": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z"),
+        "timestamp": _utcnow_iso_z(),
         "protocol": protocol,
-        "target": kwargs.get("host", kwargs.get("url", None)),
+        "target": target if target is not None else kwargs.get("host", kwargs.get("url", None)),
         "duration_ms": latency,
         "status": status,
         "reason": err,
     }
-    await queue.put(record)
+    # Serialize on the producer side, the writer treats queue items as opaque
+    # newline-terminated bytes tagged with their protocol
+    await queue.put((protocol, orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)))
 
 
 async def invoke_scheduler_with_protocol(
@@ -207,41 +266,56 @@ async def invoke_scheduler_with_protocol(
     **func_kwargs,
 ):
 
-    # Build
-    loop = asyncio.get_running_loop()
-    next_tick = loop.time()
+    # Build, the loop clock is bound as a local, it is read twice per tick
+    _now = asyncio.get_running_loop().time
+    next_tick = _now()
     run_idx = 0
     structlog.contextvars.bind_contextvars(protocol=protocol)
     await LOG.ainfo(f"Run scheduler for protocol {protocol}")
 
-    # Run
-    while not stop_event.is_set():
-
-        # Set
-        structlog.contextvars.bind_contextvars(run_id=run_idx)
-        await LOG.ainfo(f"Start collect metrics using {func.__name__} function")
-        next_tick += scheduler_interval
+    # Resolve the probe target once, it never changes between ticks
+    target = func_kwargs.get("host", func_kwargs.get("url", None))
 
+    async def _collect_once():
         try:
-            await asyncio.wait_for(
-                collect(
-                    protocol=protocol,
-                    queue=queue,
-                    func=func,
-                    **func_kwargs,
-                ),
-                # Add 0.5 seconds to the timeout to account for the time it takes
-                # to collect the latency measurement and enqueue the record
-                timeout=scheduler_timeout + 0.5,
+            # No outer wait_for, every runner bounds itself with its own timeout and
+            # the wrapper only added a timer registration and cancellation per tick
+            await collect(
+                protocol=protocol,
+                queue=queue,
+                func=func,
+                target=target,
+                **func_kwargs,
             )
         except Exception as exc:
             await LOG.aexception(f"Failed to collect metrics with {func.__name__} function on {exc}")
-            pass
-        finally:
-            await LOG.ainfo("Push record into queue")
-            run_idx += 1
 
-        await asyncio.sleep(max(0, next_tick - loop.time()))
+    # Run
+    inflight: set[asyncio.Task] = set()
+    while not stop_event.is_set():
+
+        # Checkpoint, sampled so the hot loop does not render a log line per tick
+        if run_idx % 100 == 0:
+            await LOG.ainfo(f"Collect metrics using {func.__name__} function", run_id=run_idx)
+
+        # Detach the measurement from the pacer so a slow probe cannot push the
+        # tick cadence, bounded by the in-flight set drained on stop
+        task = asyncio.create_task(_collect_once())
+        inflight.add(task)
+        task.add_done_callback(inflight.discard)
+        run_idx += 1
+
+        # Keep the cadence monotonic, skip missed ticks instead of coalescing them
+        next_tick += scheduler_interval
+        now = _now()
+        if next_tick <= now:
+            await LOG.awarning(f"Scheduler lag of {now - next_tick:.3f}s, skip missed ticks")
+            next_tick = now + scheduler_interval
+        await asyncio.sleep(max(0, next_tick - _now()))
+
+    # Drain in-flight measurements on stop
+    if inflight:
+        await asyncio.gather(*inflight, return_exceptions=True)
 
 
 async def write_batch_records_with_jsonl(
@@ -249,45 +323,77 @@ async def write_batch_records_with_jsonl(
     output: str,
     batch_size: int = 5,
     flush_interval: float = float(5.0),
-    protocol_queues: dict[str, asyncio.Queue],
+    queue: asyncio.Queue,
     stop_event: asyncio.Event,
 ):
 
-    # Set
-    buffers: dict[str, list] = {p: [] for p in protocol_queues}
+    # Set, records arrive as (protocol, serialized bytes) on one shared queue and
+    # every protocol lands in the same output file, so one combined buffer is
+    # enough and each flush is a single O_APPEND write through the executor
+    buffer = bytearray()
+    count = 0
 
-    async with aiofiles.open(output, "a") as _file:
-        while not stop_event.is_set() or any(not q.empty() for q in protocol_queues.values()):
-            for proto, queue in protocol_queues.items():
-                try:
-                    item = queue.get_nowait()
-                except asyncio.QueueEmpty:
-                    continue
+    # One pending get on the shared queue, the writer only wakes when a record
+    # arrives, the stop event fires, or the flush deadline passes
+    pending = asyncio.create_task(queue.get())
+    stop_waiter = asyncio.create_task(stop_event.wait())
 
-                buffers[proto].append(item)
-                queue.task_done()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + flush_interval
 
-                if len(buffers[proto]) >= batch_size:
-                    await _file.write(
-                        "\n".join(json.dumps(r) for r in buffers[proto]) + "\n"
-                    )
-                    buffers[proto].clear()
+    fd = os.open(output, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        while not stop_event.is_set():
+            done, _ = await asyncio.wait(
+                {stop_waiter, pending},
+                timeout=max(0.0, deadline - loop.time()),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
 
-            await asyncio.sleep(flush_interval)
+            if pending in done:
+                _, payload = pending.result()
+                buffer += payload
+                count += 1
+                queue.task_done()
+                pending = asyncio.create_task(queue.get())
+
+            # Flush on batch size, or on the deadline edge for a smaller buffer
+            now = loop.time()
+            on_edge = now >= deadline
+            if count >= batch_size or (buffer and on_edge):
+                await loop.run_in_executor(None, os.write, fd, bytes(buffer))
+                buffer.clear()
+                count = 0
+            if on_edge:
+                deadline = now + flush_interval
+
+        # Shutdown, recover the record already taken by the pending get then drain the queue
+        if pending.done() and not pending.cancelled():
+            _, payload = pending.result()
+            buffer += payload
+            queue.task_done()
+        else:
+            pending.cancel()
+        await asyncio.gather(pending, return_exceptions=True)
+
+        while True:
+            try:
+                _, payload = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            buffer += payload
+            queue.task_done()
 
         # final flush
-        for buf in buffers.values():
-            if buf:
-                await _file.write("\n".join(json.dumps(r) for r in buf) + "\n")
-
-
-def install_signal_handlers(event: asyncio.Event):
+        if buffer:
+            await loop.run_in_executor(None, os.write, fd, bytes(buffer))
+    finally:
+        os.close(fd)
 
-    def _handler(signum, frame):
-        event.set()
 
-    signal.signal(signal.SIGINT, _handler)
-    signal.signal(signal.SIGTERM, _handler)
+def install_signal_handlers(loop: asyncio.AbstractEventLoop, event: asyncio.Event):
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, event.set)
 
 
 async def run_measurement(
@@ -303,18 +409,13 @@ async def run_measurement(
     # The batch size is the number of records to write to the file at once
     batch_size: int = 5
 
-    # Checkpoint
-    await LOG.ainfo(f"Starting collector for {ip} with {len(protocols)} protocols: {protocols}")
-
-    # Match
+    # Match, one pass over the configuration with the precompiled pattern
     proto_arguments = {proto: {} for proto in protocols}
-    for proto in protocols:
-        for cfg_key, cfg_val in configuration.items():
-            p_search_result = re.search(rf"^{re.escape(proto)}[-_](?P<config_key>.+)$", cfg_key)
-            if p_search_result is None:
-                continue
-            arg_key, arg_val = p_search_result.group("config_key"), cfg_val
-            proto_arguments[proto][arg_key] = arg_val
+    for cfg_key, cfg_val in configuration.items():
+        components = _CFG_RE.match(cfg_key)
+        if components is None:
+            continue
+        proto_arguments[components["proto"]][components["key"]] = cfg_val
 
     # Build
     proto_schedulers = PROTOCOL_DEFAULT_SCHEDULERS_CONFIGURATIONS.copy()
@@ -349,37 +450,50 @@ async def run_measurement(
                 at_url = p_config["scheme"] + "://" + at_url
             proto_configurations[proto]["url"] = at_url
 
-    await LOG.ainfo(f"With arguments: {proto_arguments}")
-    await LOG.ainfo(f"With schedulers: {proto_schedulers}")
-    await LOG.ainfo(f"With configurations: {proto_configurations}")
-    await LOG.ainfo(f"With output: {output}")
+    # Checkpoint, one structured line instead of a log call per setup step
+    await LOG.ainfo(
+        "Starting collector",
+        ip=ip,
+        protocols=protocols,
+        arguments=proto_arguments,
+        schedulers=proto_schedulers,
+        configurations=proto_configurations,
+        output=output,
+        batch_size=batch_size,
+    )
 
-    # Build
-    proto_queues = {proto: asyncio.Queue() for proto in protocols}
-    await LOG.ainfo("Set queues for protocols")
+    # Build, one shared queue carries (protocol, record) pairs from every scheduler,
+    # bounded so a stalled writer suspends producers instead of growing without limit
+    record_queue = asyncio.Queue(maxsize=batch_size * len(protocols) * 4)
+
+    # Build, every http probe tick reuses the one pooled client session
+    loop = asyncio.get_running_loop()
+    http_session = _get_http_session()
+    proto_configurations["http"]["session"] = http_session
+    proto_configurations["udp"]["loop"] = loop
 
     # Set
     stop_event = asyncio.Event()
-    install_signal_handlers(event=stop_event)
-    await LOG.ainfo("Set stop event in the event loop")
+    install_signal_handlers(loop=loop, event=stop_event)
 
-    # Set
+    # Set, the writer stops on its own event, fired only after every producer has
+    # quiesced so the final drain always sees the complete queue
+    writer_stop_event = asyncio.Event()
     task_write_result_to_jsonl = asyncio.create_task(
         write_batch_records_with_jsonl(
             output=output,
-            protocol_queues=proto_queues,
+            queue=record_queue,
             batch_size=batch_size,
-            stop_event=stop_event,
+            stop_event=writer_stop_event,
         )
     )
-    await LOG.ainfo(f"Set async writer task with batch size {batch_size} records")
 
     # Build
     tasks = [
         asyncio.create_task(
             invoke_scheduler_with_protocol(
                 protocol=proto,
-                queue=proto_queues[proto],
+                queue=record_queue,
                 stop_event=stop_event,
                 func=PROTOCOL_RUNNERS[proto],
                 scheduler_interval=proto_schedulers[proto]["scheduler_interval"],
@@ -394,20 +508,25 @@ async def run_measurement(
     # Wait
     await stop_event.wait()      # ← main blocking point
 
-    for t in tasks:
-        t.cancel()
-
-    # Run
+    # Run, no cancel: each scheduler leaves its loop on the stop event within one
+    # interval and drains its in-flight probes before returning, a cancel here
+    # would orphan those probe tasks mid-measurement
     await asyncio.gather(*tasks, return_exceptions=True)
 
-    # Wait
-    for q in proto_queues.values():
-        await q.join()
+    # Handle, the writer drains the queue and flushes on its stop path, cancelling
+    # it here would discard whatever sits below the batch size in its buffer
+    writer_stop_event.set()
+    await task_write_result_to_jsonl
+    await LOG.ainfo("Flush write to output file")
 
     # Handle
-    task_write_result_to_jsonl.cancel()
-    await asyncio.gather(task_write_result_to_jsonl, return_exceptions=True)
-    await LOG.ainfo("Flush write to output file")
+    if not http_session.closed:
+        await http_session.close()
+        await LOG.ainfo("Close shared HTTP client session")
+
+    # Handle
+    _close_udp_endpoints()
+    await LOG.ainfo("Close shared UDP endpoints")
 
 
 def parse_argument_address(value: str) -> str:
@@ -486,6 +605,9 @@ if __name__ == "__main__":
     # Configure
     configure_logging(service_name="probe-collector", log_level="INFO")
 
+    # Set
+    uvloop.install()
+
     # Run
     asyncio.run(
         run_measurement(
@@ -0,0 +1,58 @@
+#!/bin/python3
+
+# Global
+from datetime import datetime, timezone
+from typing import Any
+import time
+
+# External
+from fastapi import FastAPI, status, Response
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+import orjson
+
+# Build
+app = FastAPI(
+    title="Target",
+    description="The HTTP application of Target member",
+    version="0.3.9",
+    openapi_url="/openapi.json",
+    docs_url="/documentation",
+    redoc_url=None,
+    debug=False,
+    default_response_class=ORJSONResponse,
+)
+
+# CORS middleware
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# The time-to-live of the prebuilt health body, liveness probes do not need sub-second precision
+_HEALTH_TTL: float = 1.0
+
+# The cached health body, mapped as (expire monotonic tick, serialized body)
+_HEALTH_CACHE: dict[str, Any] = {"expire": 0.0, "body": b""}
+
+
+@app.get(
+    path="/_/health",
+    tags=["Application"],
+    summary="Get the application health",
+    description="Get the application health",
+    status_code=status.HTTP_200_OK,
+)
+async def getApplicationHealth():
+    tick = time.monotonic()
+    if tick >= _HEALTH_CACHE["expire"]:
+        now = datetime.now(timezone.utc)
+        _HEALTH_CACHE["body"] = orjson.dumps({
+            "timestamp": now.isoformat(timespec="milliseconds", sep="T").replace("+00:00", "Z"),
+            "timezone": now.tzname(),
+        })
+        _HEALTH_CACHE["expire"] = tick + _HEALTH_TTL
+    return Response(content=_HEALTH_CACHE["body"], media_type="application/json")